@@ -5,12 +5,21 @@ Monitors file access and generates CAEP security events for educational purposes
 """
 
 import asyncio
+import atexit
+import functools
 import json
+import logging
+import logging.handlers
 import os
+import queue
+import re
+import stat
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set, Tuple
 
 import mcp.server.stdio
 import mcp.types as types
@@ -18,88 +27,190 @@ from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
 import aiohttp
 
+# Log to stderr via a background thread: stdout carries the MCP JSON-RPC stream
+logger = logging.getLogger("ssf-mcp")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue: queue.Queue = queue.Queue(-1)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stderr))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj: Any) -> bytes:
+    """Encode obj as JSON bytes, preferring orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # e.g. lone surrogates from non-UTF-8 filenames; stdlib escapes them
+            pass
+    return json.dumps(obj).encode()
+
+try:
+    import ahocorasick  # optional: pyahocorasick, C multi-pattern matcher
+except ImportError:
+    ahocorasick = None
+
+# Tools may only touch files under this directory
+SANDBOX_ROOT = Path("/workspace/test-files").resolve()
+
+# Larger files are truncated rather than loaded whole into the response
+MAX_INLINE_BYTES = 64 * 1024
+
+def _stat_file(path: Path) -> Tuple[bool, int]:
+    """Return (is regular file, size) from a single stat() call"""
+    try:
+        st = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return False, 0
+    return stat.S_ISREG(st.st_mode), st.st_size
+
+def _read_head(path: Path, limit: int) -> bytes:
+    """Read at most limit bytes from the start of path"""
+    with path.open("rb") as f:
+        return f.read(limit)
+
+# Pre-serialized CAEP SET skeleton: only the per-event fields are formatted in.
+# String placeholders (%s) must be passed through _dumps for escaping; the
+# quoted jti placeholder takes the raw server-generated id instead.
+_CAEP_EVENT_TEMPLATE = (
+    b'{"iss":"https://ssf-lab-mcp-server.example.com",'
+    b'"jti":"%s",'
+    b'"iat":%d,'
+    b'"aud":"https://ssf-lab-receiver.example.com",'
+    b'"sub_id":{"format":"email","email":"lab-student@example.com"},'
+    b'"events":{"https://schemas.openid.net/secevent/caep/event-type/session-risk-change":{'
+    b'"initiating_entity":"system",'
+    b'"risk_level":"high",'
+    b'"risk_type":"sensitive_file_access",'
+    b'"reason_admin":{"en":%s},'
+    b'"event_timestamp":%d,'
+    b'"custom_data":{"file_path":%s,"access_type":%s,"lab_session":true}}}}'
+)
+
 # AIDEV-NOTE: SSF transmitter integrated into MCP server per best practices
 class SecurityMCPServer:
-    def __init__(self):
+    # Event batching: flush when a batch fills up or the queue goes quiet.
+    # MAX_BATCH = 1 posts one bare SET per request (standard SSF push delivery);
+    # larger values post {"events": [...]}, which only the lab receiver accepts.
+    MAX_BATCH = 1
+    FLUSH_INTERVAL_MS = 50
+    # Backlog limits so a dead receiver can't grow memory or stall shutdown
+    MAX_QUEUED_EVENTS = 1024
+    SHUTDOWN_FLUSH_TIMEOUT_S = 5
+    
+    def __init__(self, max_connections: int = 64):
         self.server = Server("ssf-security-mcp")
         self.ssf_receiver_url = "http://localhost:8082/events"
         self.monitored_patterns = [".secret", ".credentials", "/secure/", "api-key", "password"]
         self.event_count = 0
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+        self._http_sem = asyncio.Semaphore(max_connections)
+        self._pending: Set[asyncio.Task] = set()
+        self._event_q: asyncio.Queue = asyncio.Queue(maxsize=self.MAX_QUEUED_EVENTS)
+        self._flusher: asyncio.Task | None = None
+        self._build_matcher()
         
         # Register tools
         self.setup_tools()
     
     def setup_tools(self):
+        # Tool descriptors and dispatch are static, so build them once
+        self._tools = [
+            types.Tool(
+                name="read_file_secure",
+                description="Read file contents with security monitoring",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "path": {
+                            "type": "string",
+                            "description": "Path to the file to read"
+                        }
+                    },
+                    "required": ["path"]
+                }
+            ),
+            types.Tool(
+                name="list_files_secure", 
+                description="List files in directory with security monitoring",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "path": {
+                            "type": "string",
+                            "description": "Directory path to list",
+                            "default": "/workspace/test-files"
+                        }
+                    }
+                }
+            )
+        ]
+        self._tool_handlers = {
+            "read_file_secure": lambda args: self.handle_file_read(args["path"]),
+            "list_files_secure": lambda args: self.handle_list_files(
+                args.get("path", "/workspace/test-files")
+            ),
+        }
+        
         @self.server.list_tools()
         async def handle_list_tools() -> List[types.Tool]:
             """List available tools for the MCP client"""
-            return [
-                types.Tool(
-                    name="read_file_secure",
-                    description="Read file contents with security monitoring",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "path": {
-                                "type": "string",
-                                "description": "Path to the file to read"
-                            }
-                        },
-                        "required": ["path"]
-                    }
-                ),
-                types.Tool(
-                    name="list_files_secure", 
-                    description="List files in directory with security monitoring",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "path": {
-                                "type": "string",
-                                "description": "Directory path to list",
-                                "default": "/workspace/test-files"
-                            }
-                        }
-                    }
-                )
-            ]
+            return self._tools
         
         @self.server.call_tool()
         async def handle_call_tool(
             name: str, arguments: Dict[str, Any]
         ) -> List[types.TextContent]:
             """Handle tool calls with security monitoring"""
-            
-            if name == "read_file_secure":
-                return await self.handle_file_read(arguments["path"])
-            elif name == "list_files_secure":
-                path = arguments.get("path", "/workspace/test-files")
-                return await self.handle_list_files(path)
-            else:
+            handler = self._tool_handlers.get(name)
+            if handler is None:
                 raise ValueError(f"Unknown tool: {name}")
+            return await handler(arguments)
     
     async def handle_file_read(self, filepath: str) -> List[types.TextContent]:
         """Handle secure file reading with event generation"""
         try:
-            # Normalize path
-            abs_path = Path(filepath).resolve()
+            # Normalize path (resolve() hits the filesystem, keep it off the loop)
+            abs_path = await asyncio.to_thread(Path(filepath).resolve)
             
             # Check if file is sensitive
             is_sensitive = self.is_sensitive_file(str(abs_path))
             
-            # Generate SSF event if sensitive
+            # Generate SSF event if sensitive (delivered in the background)
             if is_sensitive:
-                await self.generate_caep_event(str(abs_path), "file_access")
+                task = asyncio.create_task(
+                    self.generate_caep_event(str(abs_path), "file_access")
+                )
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
             
             # Read file content (sandbox to test-files directory)
-            if not str(abs_path).startswith("/workspace/test-files"):
+            if not abs_path.is_relative_to(SANDBOX_ROOT):
                 return [types.TextContent(
                     type="text",
                     text=f"⚠️  Access denied: File outside allowed directory\nPath: {abs_path}"
                 )]
             
-            if abs_path.exists() and abs_path.is_file():
-                content = abs_path.read_text()
+            is_file, size = await asyncio.to_thread(_stat_file, abs_path)
+            if is_file:
+                # Read one byte past the limit so truncation is decided by what
+                # was actually read, even if the file grew since the stat()
+                data = await asyncio.to_thread(_read_head, abs_path, MAX_INLINE_BYTES + 1)
+                if len(data) > MAX_INLINE_BYTES:
+                    content = (
+                        data[:MAX_INLINE_BYTES].decode("utf-8", "replace")
+                        + f"\n\n✂️  (truncated {max(size, len(data)) - MAX_INLINE_BYTES} bytes)"
+                    )
+                else:
+                    content = data.decode("utf-8")
                 event_notice = "🔒 SECURITY EVENT GENERATED" if is_sensitive else ""
                 
                 return [types.TextContent(
@@ -121,19 +232,36 @@ class SecurityMCPServer:
     async def handle_list_files(self, dirpath: str) -> List[types.TextContent]:
         """Handle secure directory listing"""
         try:
-            abs_path = Path(dirpath).resolve()
+            abs_path = await asyncio.to_thread(Path(dirpath).resolve)
             
-            if not abs_path.exists() or not abs_path.is_dir():
+            # Sandbox listings to test-files directory
+            if not abs_path.is_relative_to(SANDBOX_ROOT):
+                return [types.TextContent(
+                    type="text",
+                    text=f"⚠️  Access denied: Directory outside allowed directory\nPath: {abs_path}"
+                )]
+            
+            exists, is_dir = await asyncio.to_thread(
+                lambda: (abs_path.exists(), abs_path.is_dir())
+            )
+            if not exists or not is_dir:
                 return [types.TextContent(
                     type="text",
                     text=f"❌ Directory not found: {abs_path}"
                 )]
             
+            # Walk the directory in a worker thread; DirEntry caches the
+            # file type from readdir, so is_dir() only stats symlinks
+            def scan():
+                with os.scandir(abs_path) as it:
+                    return [(entry, entry.is_dir()) for entry in it]
+            entries = await asyncio.to_thread(scan)
+            
             files = []
-            for item in abs_path.iterdir():
-                is_sensitive = self.is_sensitive_file(str(item))
-                icon = "🔒" if is_sensitive else ("📁" if item.is_dir() else "📄")
-                files.append(f"{icon} {item.name}")
+            for entry, entry_is_dir in entries:
+                is_sensitive = self.is_sensitive_file(entry.path)
+                icon = "🔒" if is_sensitive else ("📁" if entry_is_dir else "📄")
+                files.append(f"{icon} {entry.name}")
             
             return [types.TextContent(
                 type="text",
@@ -146,83 +274,186 @@ class SecurityMCPServer:
                 text=f"❌ Error listing directory: {e}"
             )]
     
+    def _build_matcher(self):
+        """Precompile monitored_patterns into a single multi-pattern matcher"""
+        if not self.monitored_patterns:
+            # Nothing to match; an empty regex would match every path
+            self._matcher = None
+            self._pattern_re = None
+        elif ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for pattern in self.monitored_patterns:
+                automaton.add_word(pattern, pattern)
+            automaton.make_automaton()
+            self._matcher = automaton
+            self._pattern_re = None
+        else:
+            self._matcher = None
+            self._pattern_re = re.compile(
+                "|".join(re.escape(pattern) for pattern in self.monitored_patterns)
+            )
+        # Fresh cache per matcher so results never outlive the patterns they came from
+        self._match_sensitive = functools.lru_cache(maxsize=4096)(self._match_uncached)
+    
     def is_sensitive_file(self, filepath: str) -> bool:
         """Check if file matches sensitive patterns"""
-        filepath_lower = filepath.lower()
-        return any(pattern in filepath_lower for pattern in self.monitored_patterns)
+        return self._match_sensitive(filepath.lower())
+    
+    def _match_uncached(self, filepath_lower: str) -> bool:
+        if self._matcher is not None:
+            return next(self._matcher.iter(filepath_lower), None) is not None
+        if self._pattern_re is not None:
+            return self._pattern_re.search(filepath_lower) is not None
+        return False
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared receiver session, creating it on the running loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.max_connections,
+                    keepalive_timeout=30
+                ),
+                timeout=aiohttp.ClientTimeout(total=2)
+            )
+        return self._session
+    
+    async def aclose(self):
+        """Flush in-flight events and release the shared receiver session"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._flusher is not None:
+            try:
+                await asyncio.wait_for(
+                    self._event_q.join(), timeout=self.SHUTDOWN_FLUSH_TIMEOUT_S
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "⚠️  Gave up flushing %d queued SSF event(s) on shutdown",
+                    self._event_q.qsize()
+                )
+            stragglers = [self._flusher, *self._pending]
+            for task in stragglers:
+                task.cancel()
+            await asyncio.gather(*stragglers, return_exceptions=True)
+            self._flusher = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
     
     async def generate_caep_event(self, filepath: str, access_type: str):
         """Generate and send CAEP security event (integrated transmitter)"""
-        self.event_count += 1
+        try:
+            self.event_count += 1
         
-        # Create CAEP-compliant event
-        event = {
-            "iss": "https://ssf-lab-mcp-server.example.com",
-            "jti": f"event-{int(time.time())}-{self.event_count}",
-            "iat": int(time.time()),
-            "aud": "https://ssf-lab-receiver.example.com",
-            "sub_id": {
-                "format": "email",
-                "email": "lab-student@example.com"
-            },
-            "events": {
-                "https://schemas.openid.net/secevent/caep/event-type/session-risk-change": {
-                    "initiating_entity": "system",
-                    "risk_level": "high",
-                    "risk_type": "sensitive_file_access",
-                    "reason_admin": {
-                        "en": f"Sensitive file accessed: {os.path.basename(filepath)}"
-                    },
-                    "event_timestamp": int(time.time() * 1000),
-                    "custom_data": {
-                        "file_path": filepath,
-                        "access_type": access_type,
-                        "lab_session": True
-                    }
-                }
-            }
-        }
+            # One clock read so jti, iat and event_timestamp agree
+            now = time.time()
+            iat = int(now)
+            filename = os.path.basename(filepath)
+            
+            # Create CAEP-compliant event, serialized once here
+            jti = f"event-{iat}-{self.event_count}"
+            body = _CAEP_EVENT_TEMPLATE % (
+                jti.encode(),
+                iat,
+                _dumps(f"Sensitive file accessed: {filename}"),
+                int(now * 1000),
+                _dumps(filepath),
+                _dumps(access_type),
+            )
         
-        # Log event locally (console output)
-        print(f"🚨 SSF EVENT GENERATED: {datetime.now().isoformat()}")
-        print(f"   File: {filepath}")
-        print(f"   Risk Level: HIGH")
-        print(f"   Event ID: {event['jti']}")
+            # Log event locally (stderr)
+            logger.info(
+                "🚨 SSF EVENT GENERATED: %s\n   File: %s\n   Risk Level: HIGH\n   Event ID: %s",
+                datetime.fromtimestamp(now).isoformat(), filepath, jti
+            )
         
-        # Send to receiver (if running)
+            # Queue for batched delivery to receiver
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self._flush_loop())
+            try:
+                self._event_q.put_nowait(body)
+            except asyncio.QueueFull:
+                logger.warning("⚠️  Event queue full, dropping SSF event: %s", jti)
+        except Exception as e:
+            # Runs as a background task, so nothing upstream will see this
+            logger.warning("⚠️  Failed to generate SSF event: %s", e)
+    
+    async def _flush_loop(self):
+        """Drain queued events and deliver them to the receiver in batches"""
+        while True:
+            batch = [await self._event_q.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(await asyncio.wait_for(
+                        self._event_q.get(), timeout=self.FLUSH_INTERVAL_MS / 1000
+                    ))
+                except asyncio.TimeoutError:
+                    break
+            # Wait for a free slot so at most max_connections POSTs are in flight,
+            # then send without blocking the next batch from being collected
+            await self._http_sem.acquire()
+            task = asyncio.create_task(self._deliver_batch(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+    
+    async def _deliver_batch(self, batch: List[bytes]):
+        """Send one batch, then free its connection slot and queue entries"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.ssf_receiver_url,
-                    json=event,
-                    headers={"Content-Type": "application/json"},
-                    timeout=aiohttp.ClientTimeout(total=2)
-                ) as response:
-                    if response.status == 200:
-                        print(f"✅ Event delivered to receiver")
-                    else:
-                        print(f"⚠️  Receiver returned status: {response.status}")
+            await self._send_batch(batch)
+        finally:
+            self._http_sem.release()
+            for _ in batch:
+                self._event_q.task_done()
+    
+    async def _send_batch(self, batch: List[bytes]):
+        """POST a batch of pre-encoded events to the receiver (if running)"""
+        try:
+            if self.MAX_BATCH == 1:
+                payload = batch[0]
+            else:
+                payload = b'{"events":[' + b",".join(batch) + b"]}"
+            session = await self._get_session()
+            async with session.post(
+                self.ssf_receiver_url,
+                data=payload,
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                if response.status == 200:
+                    logger.info("✅ %d event(s) delivered to receiver", len(batch))
+                else:
+                    logger.warning("⚠️  Receiver returned status: %s", response.status)
         except Exception as e:
-            print(f"⚠️  Receiver not available: {e}")
+            logger.warning("⚠️  Receiver not available: %s", e)
 
 async def main():
     """Run the MCP server"""
+    # Bound the worker pool used by asyncio.to_thread for file I/O
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=8))
     server_instance = SecurityMCPServer()
     
-    # Run the server with stdio transport
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server_instance.server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="ssf-security-mcp",
-                server_version="1.0.0",
-                capabilities=server_instance.server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    try:
+        # Run the server with stdio transport
+        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await server_instance.server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="ssf-security-mcp",
+                    server_version="1.0.0",
+                    capabilities=server_instance.server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    )
                 )
             )
-        )
+    finally:
+        await server_instance.aclose()
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # optional: faster libuv-based event loop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
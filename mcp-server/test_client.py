@@ -5,18 +5,20 @@ Tests file access and event generation without requiring AI assistant integratio
 """
 
 import asyncio
+import io
 import json
 import sys
 from pathlib import Path
 from server import SecurityMCPServer
 
-async def test_file_access(filepath: str):
-    """Test file access and event generation"""
-    print(f"\n🧪 Testing file access: {filepath}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+async def test_file_access(server: SecurityMCPServer, filepath: str) -> str:
+    """Test file access and event generation
     
-    # Create server instance
-    server = SecurityMCPServer()
+    Output is buffered and returned so concurrent tests don't interleave.
+    """
+    out = io.StringIO()
+    print(f"\n🧪 Testing file access: {filepath}", file=out)
+    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━", file=out)
     
     try:
         # Test file reading
@@ -24,18 +26,18 @@ async def test_file_access(filepath: str):
         
         # Display results
         for content in result:
-            print(content.text)
+            print(content.text, file=out)
             
     except Exception as e:
-        print(f"❌ Error: {e}")
+        print(f"❌ Error: {e}", file=out)
+    
+    return out.getvalue()
 
-async def test_directory_listing(dirpath: str = "/workspace/test-files"):
+async def test_directory_listing(server: SecurityMCPServer, dirpath: str = "/workspace/test-files"):
     """Test directory listing"""
     print(f"\n📁 Testing directory listing: {dirpath}")
     print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
     
-    server = SecurityMCPServer()
-    
     try:
         result = await server.handle_list_files(dirpath)
         for content in result:
@@ -48,22 +50,38 @@ async def main():
     print("🚀 SSF Security MCP Server - Test Client")
     print("========================================")
     
-    # Test directory listing first
-    await test_directory_listing()
-    
-    # Test files from command line args or defaults
-    test_files = sys.argv[1:] if len(sys.argv) > 1 else [
-        "/workspace/test-files/public-data.txt",
-        "/workspace/test-files/user-credentials.secret", 
-        "/workspace/test-files/api-keys.credentials"
-    ]
+    # One server instance for the whole run (shared session and matcher)
+    server = SecurityMCPServer()
     
-    for filepath in test_files:
-        await test_file_access(filepath)
+    try:
+        # Test directory listing first
+        await test_directory_listing(server)
+        
+        # Test files from command line args or defaults
+        test_files = sys.argv[1:] if len(sys.argv) > 1 else [
+            "/workspace/test-files/public-data.txt",
+            "/workspace/test-files/user-credentials.secret", 
+            "/workspace/test-files/api-keys.credentials"
+        ]
+        
+        # Read all files concurrently, then print results in order
+        outputs = await asyncio.gather(
+            *(test_file_access(server, filepath) for filepath in test_files)
+        )
+        for output in outputs:
+            print(output, end="")
+    finally:
+        # Flush queued events before exiting
+        await server.aclose()
     
     print("\n✅ Test completed!")
     print("\n💡 Check the SSF Receiver dashboard at http://localhost:8082")
     print("   to see any security events that were generated.")
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # optional: faster libuv-based event loop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
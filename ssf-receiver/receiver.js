@@ -46,9 +46,13 @@ class SSFReceiver {
         // Main event reception endpoint  
         this.app.post('/events', (req, res) => {
             try {
-                const event = req.body;
-                this.processEvent(event);
-                res.status(200).json({ status: 'received' });
+                const body = req.body;
+                // Accept a single SET or a batch wrapped as { events: [...] }
+                const events = Array.isArray(body.events) ? body.events : [body];
+                // Reject the whole batch before logging/storing any of it
+                events.forEach(event => this.validateEvent(event));
+                events.forEach(event => this.processEvent(event));
+                res.status(200).json({ status: 'received', count: events.length });
             } catch (error) {
                 console.error('❌ Error processing event:', error.message);
                 res.status(400).json({ error: 'Invalid event format' });
@@ -70,12 +74,14 @@ class SSFReceiver {
         });
     }
 
-    processEvent(event) {
+    validateEvent(event) {
         // Validate SSF SET structure
-        if (!event.iss || !event.jti || !event.events) {
+        if (!event || !event.iss || !event.jti || !event.events) {
             throw new Error('Invalid SSF SET structure');
         }
+    }
 
+    processEvent(event) {
         const timestamp = new Date().toISOString();
         const eventTypes = Object.keys(event.events);
         